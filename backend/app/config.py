@@ -0,0 +1,57 @@
+"""
+アプリケーション設定
+
+backend/.env と環境変数から設定値を読み込む。
+Settings の生成と .env の読み込みはプロセス内で1回だけ行い、以降はキャッシュを返す。
+"""
+
+import os
+from functools import cached_property, lru_cache
+
+from dotenv import load_dotenv
+from pydantic import BaseModel, Field
+
+# backend/.env を確実に読み込む(どこから起動しても動くように)
+_backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_ENV_PATH = os.path.join(_backend_dir, ".env")
+
+_loaded = False
+
+
+def load_env() -> None:
+    """backend/.env を環境変数に読み込む(2回目以降の呼び出しでは何もしない)"""
+    global _loaded
+    if _loaded:
+        return
+    load_dotenv(_ENV_PATH)
+    _loaded = True
+
+
+class Settings(BaseModel):
+    """環境変数から組み立てるアプリケーション設定"""
+
+    groq_api_key: str | None = Field(
+        default_factory=lambda: (os.getenv("GROQ_API_KEY") or "").strip() or None,
+        description="Groq API キー",
+    )
+    cors_origins: str = Field(
+        default_factory=lambda: (os.getenv("CORS_ORIGINS") or "*").strip(),
+        description="CORSを許可するオリジン(カンマ区切り)",
+    )
+
+    youtube_proxy_url: str | None = Field(
+        default_factory=lambda: (os.getenv("YOUTUBE_PROXY_URL") or "").strip() or None,
+        description="YouTube 字幕取得に使うプロキシURL",
+    )
+
+    @cached_property
+    def allow_origins_list(self) -> list[str]:
+        """CORS_ORIGINS をリストに変換する(前後スペース・改行は除去、空なら *。初回のみ計算)"""
+        return [o.strip() for o in self.cors_origins.split(",") if o.strip()] or ["*"]
+
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """設定を取得する(初回のみ .env を読み込んで生成し、以降はキャッシュを返す)"""
+    load_env()
+    return Settings()
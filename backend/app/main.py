@@ -3,17 +3,16 @@ FastAPI アプリケーションのエントリポイント
 """
 
 import logging
-import os
 from contextlib import asynccontextmanager
 
-from dotenv import load_dotenv
+from app.config import get_settings
 
-# backend/.env を確実に読み込む(どこから起動しても動くように)
-_backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-load_dotenv(os.path.join(_backend_dir, ".env"))
+# backend/.env を読み込んでから各モジュールを import する(環境変数を import 時に参照するため)
+settings = get_settings()
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from groq import AsyncGroq
 
 from app.routers import summarize
 
@@ -28,8 +27,15 @@ logger = logging.getLogger(__name__)
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """アプリケーションのライフサイクル管理"""
+    # Groq クライアントはリクエストごとに作らず、接続プールごと使い回す
+    # (APIキー未設定時は None のままにし、要約リクエスト時にエラーを返す)
+    app.state.groq = (
+        AsyncGroq(api_key=settings.groq_api_key) if settings.groq_api_key else None
+    )
     logger.info("YouTube Summarizer API を起動しました")
     yield
+    if app.state.groq is not None:
+        await app.state.groq.close()
     logger.info("YouTube Summarizer API を停止しました")
 
 
@@ -41,8 +47,7 @@ app = FastAPI(
 )
 
 # CORS設定(本番では CORS_ORIGINS にフロントのURLを指定。前後スペース・改行は自動で除去)
-_cors_origins = (os.getenv("CORS_ORIGINS") or "*").strip()
-allow_origins = [o.strip() for o in _cors_origins.split(",") if o.strip()] or ["*"]
+allow_origins = settings.allow_origins_list
 logger.info("CORS allow_origins: %s", allow_origins)
 app.add_middleware(
     CORSMiddleware,
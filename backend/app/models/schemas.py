@@ -3,9 +3,17 @@ Pydantic スキーマ定義
 リクエスト・レスポンスのバリデーションを担当
 """
 
-from pydantic import BaseModel, Field, field_validator
+from typing import Any
+
+from pydantic import BaseModel, Field, PrivateAttr, field_validator
 import re
 
+# YouTube URL の判定パターン(リクエストごとに再構築しないようモジュール読み込み時にコンパイル)
+# watch / 短縮URL / shorts を1つの正規表現にまとめ、1回の走査で判定する
+_YOUTUBE_URL_RE = re.compile(
+    r"^https?://(?:(?:www\.)?youtube\.com/(?:watch\?v=|shorts/)|youtu\.be/)([\w-]{11})"
+)
+
 
 class SummarizeRequest(BaseModel):
     """要約リクエストのスキーマ"""
@@ -20,19 +28,25 @@ class SummarizeRequest(BaseModel):
         description="字幕の言語コード(例: ja, en)",
     )
 
+    _video_id: str = PrivateAttr(default="")
+
     @field_validator("url")
     @classmethod
     def validate_youtube_url(cls, v: str) -> str:
-        """YouTube URLのバリデーション"""
-        youtube_patterns = [
-            r"^https?://(www\.)?youtube\.com/watch\?v=[\w-]{11}",
-            r"^https?://youtu\.be/[\w-]{11}",
-            r"^https?://(www\.)?youtube\.com/shorts/[\w-]{11}",
-        ]
-        if not any(re.match(pattern, v) for pattern in youtube_patterns):
+        """YouTube URLのバリデーション(エラーは url フィールドに対して報告する)"""
+        if not _YOUTUBE_URL_RE.match(v):
             raise ValueError("有効なYouTube URLを入力してください")
         return v
 
+    def model_post_init(self, __context: Any) -> None:
+        """検証済みのURLから動画IDを抽出して保持する"""
+        self._video_id = _YOUTUBE_URL_RE.match(self.url).group(1)
+
+    @property
+    def video_id(self) -> str:
+        """バリデーション時に抽出した YouTube 動画ID"""
+        return self._video_id
+
 
 class TranscriptSegment(BaseModel):
     """字幕セグメントのスキーマ"""
@@ -48,8 +62,8 @@ class TranscriptResult(BaseModel):
     video_id: str = Field(..., description="YouTube動画ID")
     title: str = Field(default="", description="動画タイトル")
     language: str = Field(..., description="字幕の言語コード")
-    segments: list[TranscriptSegment] = Field(..., description="字幕セグメントのリスト")
-    full_text: str = Field(..., description="結合済み字幕テキスト")
+    timestamped_text: str = Field(..., description="各行に [秒数] を付与した結合済み字幕テキスト")
+    transcript_length: int = Field(..., description="字幕の文字数")
 
 
 class KeyPointItem(BaseModel):
@@ -4,7 +4,9 @@ POST /api/summarize - YouTube動画の字幕を取得し要約を返す
 """
 
 import logging
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
+from groq import AsyncGroq
+from pydantic import ValidationError
 
 from app.models.schemas import SummarizeRequest, SummarizeResponse, ErrorResponse, KeyPointItem
 from app.services.youtube import fetch_transcript, YouTubeTranscriptError
@@ -15,6 +17,11 @@ logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api", tags=["summarize"])
 
 
+def get_groq_client(request: Request) -> AsyncGroq | None:
+    """lifespan で生成した共有 Groq クライアントを返す(未生成なら None)"""
+    return getattr(request.app.state, "groq", None)
+
+
 @router.post(
     "/summarize",
     response_model=SummarizeResponse,
@@ -26,24 +33,27 @@ router = APIRouter(prefix="/api", tags=["summarize"])
     summary="YouTube動画を要約する",
     description="YouTube動画のURLを受け取り、字幕を取得してClaude APIで要約を生成する",
 )
-async def summarize_video(request: SummarizeRequest) -> SummarizeResponse:
+async def summarize_video(
+    request: SummarizeRequest,
+    groq_client: AsyncGroq | None = Depends(get_groq_client),
+) -> SummarizeResponse:
     """
     YouTube動画の要約エンドポイント
 
     処理フロー:
-    1. URLから動画IDを抽出
+    1. URLから動画IDを抽出(リクエストのバリデーション時に実施済み)
     2. 字幕テキストを取得
     3. Claude APIで要約を生成
     4. 結果を返却
     """
-    # ステップ1-2: 字幕を取得
+    # ステップ2: 字幕を取得
     try:
         transcript = await fetch_transcript(
-            url=request.url,
+            video_id=request.video_id,
             language=request.language,
         )
     except YouTubeTranscriptError as e:
-        logger.warning(f"字幕取得エラー: {e.message}")
+        logger.warning("字幕取得エラー: %s", e.message)
         status_code = 404 if e.error_code == "NO_TRANSCRIPT" else 400
         raise HTTPException(
             status_code=status_code,
@@ -51,14 +61,11 @@ async def summarize_video(request: SummarizeRequest) -> SummarizeResponse:
         )
 
     # ステップ3: Groq APIで要約を生成(字幕に [秒数] を付与して時刻付きキーポイントを得る)
-    timestamped_text = "\n".join(
-        f"[{int(seg.start)}] {seg.text}" for seg in transcript.segments
-    )
     try:
-        service = SummarizerService()
-        result = await service.summarize_transcript(timestamped_text)
+        service = SummarizerService(client=groq_client)
+        result = await service.summarize_transcript(transcript.timestamped_text)
     except Exception as e:
-        logger.error(f"要約生成エラー: {e}")
+        logger.error("要約生成エラー: %s", e)
         raise HTTPException(
             status_code=500,
             detail={
@@ -68,16 +75,27 @@ async def summarize_video(request: SummarizeRequest) -> SummarizeResponse:
         )
 
     # ステップ4: レスポンスを返却
-    key_point_items = [
-        KeyPointItem(text=kp.text, start_seconds=kp.start_seconds)
-        for kp in result.key_points
-    ]
-    return SummarizeResponse(
-        video_id=transcript.video_id,
-        title=result.title,
-        summary=result.summary,
-        key_points=key_point_items,
-        topics=result.topics,
-        language=transcript.language,
-        transcript_length=len(transcript.full_text),
-    )
+    # (LLM の JSON をそのまま受けた値のため、型が合わなければ要約失敗として 500 を返す)
+    try:
+        key_point_items = [
+            KeyPointItem(text=kp.text, start_seconds=kp.start_seconds)
+            for kp in result.key_points
+        ]
+        return SummarizeResponse(
+            video_id=transcript.video_id,
+            title=result.title,
+            summary=result.summary,
+            key_points=key_point_items,
+            topics=result.topics,
+            language=transcript.language,
+            transcript_length=transcript.transcript_length,
+        )
+    except ValidationError as e:
+        logger.error("要約結果の形式が不正です: %s", e)
+        raise HTTPException(
+            status_code=500,
+            detail={
+                "detail": "要約の生成に失敗しました",
+                "error_code": "SUMMARIZE_FAILED",
+            },
+        )
@@ -0,0 +1,59 @@
+"""
+プロセス内キャッシュ
+
+同じ動画が繰り返し要約されるケースに備え、字幕取得結果などを
+有効期限付きの LRU キャッシュとしてメモリ上に保持する。
+"""
+
+import time
+from collections import OrderedDict
+from collections.abc import Hashable
+from typing import Generic, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class TTLCache(Generic[K, V]):
+    """
+    有効期限(TTL)付きの LRU キャッシュ。
+
+    単一のイベントループ内から使う前提のため、ロックは取らない。
+    上限件数を超えた場合は最も長く参照されていないエントリから破棄する。
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        """
+        Args:
+            maxsize: 保持する最大件数。
+            ttl: 各エントリの有効期限(秒)。
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[K, tuple[float, V]] = OrderedDict()
+
+    def get(self, key: K) -> V | None:
+        """キーに対応する値を返す。未登録または期限切れなら None。"""
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: K, value: V) -> None:
+        """値を登録する(既存のキーは上書きし、有効期限を延長する)。"""
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        """全エントリを破棄する。"""
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
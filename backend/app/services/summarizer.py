@@ -5,22 +5,46 @@ Groq Python SDK を利用し、長い字幕テキストをチャンク分割し
 段階的に要約を生成するパイプラインを提供する。
 """
 
+import asyncio
+import hashlib
 import os
 import logging
+import string
+import weakref
 from dataclasses import dataclass
 
+import orjson
 from groq import AsyncGroq
 
+from app.services.cache import TTLCache
+
 logger = logging.getLogger(__name__)
 
 # --- 定数 ---
 MODEL_ID = "llama-3.3-70b-versatile"
-# 1チャンクあたりの最大文字数(日本語は1文字≒1-2トークン、余裕を持たせる)
-DEFAULT_CHUNK_SIZE = 8000
-# チャンク間のオーバーラップ文字数(文脈の断絶を防ぐ)
-DEFAULT_CHUNK_OVERLAP = 500
+# モデルのコンテキスト長(トークン数)
+MODEL_CONTEXT_TOKENS = 131_072
 # API呼び出し時の最大出力トークン数
 MAX_OUTPUT_TOKENS = 4096
+# プロンプトテンプレート(最長でも700文字弱)に見込むトークン数
+PROMPT_OVERHEAD_TOKENS = 2048
+# 1文字あたりのトークン数の見積もり(日本語は1文字≒1-2トークンのため、多い側で見積もる)
+TOKENS_PER_CHAR = 2
+# 1チャンクあたりの最大文字数
+# コンテキストから出力とプロンプトの分を除いた残りに収まる文字数とし、
+# チャンク数(=API呼び出し回数)をできるだけ抑える
+DEFAULT_CHUNK_SIZE = (MODEL_CONTEXT_TOKENS - MAX_OUTPUT_TOKENS - PROMPT_OVERHEAD_TOKENS) // TOKENS_PER_CHAR
+# チャンク間のオーバーラップ文字数(文脈の断絶を防ぐ)
+DEFAULT_CHUNK_OVERLAP = 500
+# チャンクの区切り位置として優先する文字列(先頭ほど優先)
+_SPLIT_DELIMITERS = ("。", "\n\n", "\n", "、", ".", " ")
+# Groq API への同時リクエスト数の上限(レート制限対策。プロセス内の全リクエストで共有する)
+MAX_CONCURRENT_API_CALLS = 4
+# 要約結果キャッシュの最大件数と有効期限(秒)
+SUMMARY_CACHE_MAXSIZE = 256
+SUMMARY_CACHE_TTL = 3600
+# JSONパース失敗時のフォールバック結果に付けるタイトル(キャッシュしない)
+PARSE_FAILED_TITLE = "要約の生成に部分的に成功"
 
 
 # --- プロンプトテンプレート ---
@@ -95,27 +119,85 @@ JSONのみを出力し、それ以外のテキストは含めないでくださ
 - topics は動画の主題を表すキーワードを2〜5個"""
 
 
+class _PromptTemplate:
+    """
+    str.format 形式のテンプレートを読み込み時に定数部分とプレースホルダに分解しておき、
+    呼び出しごとの書式解析を省いて連結だけで組み立てる。
+    """
+
+    __slots__ = ("_parts",)
+
+    def __init__(self, template: str):
+        parts: list[tuple[str, str | None]] = []
+        for literal, field, spec, conversion in string.Formatter().parse(template):
+            if spec or conversion:
+                raise ValueError("書式指定・変換指定を含むプレースホルダには対応していません")
+            parts.append((literal, field))
+        self._parts = tuple(parts)
+
+    def render(self, **values: object) -> str:
+        """プレースホルダに値を埋め込んだ文字列を返す(結果は template.format と同じ)。"""
+        pieces: list[str] = []
+        for literal, field in self._parts:
+            pieces.append(literal)
+            if field is not None:
+                pieces.append(str(values[field]))
+        return "".join(pieces)
+
+
+_CHUNK_SUMMARY_TEMPLATE = _PromptTemplate(CHUNK_SUMMARY_PROMPT)
+_FINAL_SUMMARY_TEMPLATE = _PromptTemplate(FINAL_SUMMARY_PROMPT)
+_SHORT_TEXT_TEMPLATE = _PromptTemplate(SHORT_TEXT_PROMPT)
+
+# プロンプトを変更したら古いキャッシュが使われないよう、キーにテンプレートのハッシュを含める
+_PROMPT_FINGERPRINT = hashlib.blake2b(
+    "\0".join((CHUNK_SUMMARY_PROMPT, FINAL_SUMMARY_PROMPT, SHORT_TEXT_PROMPT)).encode(),
+    digest_size=8,
+).hexdigest()
+
+
+# --- API 呼び出しの同時実行制限 ---
+
+# イベントループごとの Groq API 呼び出しの同時実行リミッター(_get_api_limiter で生成)
+_api_limiters: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _get_api_limiter() -> asyncio.Semaphore:
+    """
+    実行中のイベントループで共有する API 呼び出しリミッターを返す(初回のみ生成)
+
+    Semaphore は最初に待ったイベントループに結び付くため、ループごとに1つずつ持つ。
+    """
+    loop = asyncio.get_running_loop()
+    limiter = _api_limiters.get(loop)
+    if limiter is None:
+        limiter = _api_limiters[loop] = asyncio.Semaphore(MAX_CONCURRENT_API_CALLS)
+    return limiter
+
+
 # --- データクラス ---
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class KeyPointItem:
     """キーポイント1件(開始秒数は任意)"""
     text: str
     start_seconds: int | None = None
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class SummaryResult:
-    """要約結果を格納するデータクラス。"""
+    """要約結果を格納するデータクラス(キャッシュで共有するため、リストもタプルで持つ)。"""
     title: str
     summary: str
-    key_points: list[KeyPointItem]
-    topics: list[str]
+    key_points: tuple[KeyPointItem, ...]
+    topics: tuple[str, ...]
     chunk_count: int = 1
     model: str = MODEL_ID
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class ChunkInfo:
     """分割されたチャンクの情報。"""
     text: str
@@ -123,6 +205,13 @@ class ChunkInfo:
     total_parts: int
 
 
+# 字幕テキスト(とモデル・プロンプト・分割設定)が同じなら要約結果を使い回す
+_summary_cache: TTLCache[str, SummaryResult] = TTLCache(
+    maxsize=SUMMARY_CACHE_MAXSIZE,
+    ttl=SUMMARY_CACHE_TTL,
+)
+
+
 # --- メインサービス ---
 
 class SummarizerService:
@@ -138,19 +227,23 @@ class SummarizerService:
         api_key: str | None = None,
         chunk_size: int = DEFAULT_CHUNK_SIZE,
         chunk_overlap: int = DEFAULT_CHUNK_OVERLAP,
+        client: AsyncGroq | None = None,
     ):
         """
         Args:
             api_key: Groq API キー。未指定時は環境変数 GROQ_API_KEY を使用。
             chunk_size: 1チャンクあたりの最大文字数。
             chunk_overlap: チャンク間のオーバーラップ文字数。
+            client: 共有する AsyncGroq クライアント。指定時は api_key を無視して再利用する。
         """
-        resolved_key = api_key or os.getenv("GROQ_API_KEY")
-        if not resolved_key:
-            raise ValueError(
-                "APIキーが設定されていません。引数 api_key または環境変数 GROQ_API_KEY を設定してください。"
-            )
-        self.client = AsyncGroq(api_key=resolved_key)
+        if client is None:
+            resolved_key = api_key or os.getenv("GROQ_API_KEY")
+            if not resolved_key:
+                raise ValueError(
+                    "APIキーが設定されていません。引数 api_key または環境変数 GROQ_API_KEY を設定してください。"
+                )
+            client = AsyncGroq(api_key=resolved_key)
+        self.client = client
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
 
@@ -160,6 +253,7 @@ class SummarizerService:
 
         短いテキスト(1チャンク以内)は直接要約し、
         長いテキストはチャンク分割パイプラインで処理する。
+        同じ入力に対する結果はキャッシュし、API呼び出しを省略する。
 
         Args:
             transcript: YouTube動画の字幕テキスト全文。
@@ -175,14 +269,35 @@ class SummarizerService:
         if not transcript:
             raise ValueError("字幕テキストが空です。")
 
+        cache_key = self._cache_key(transcript)
+        cached = _summary_cache.get(cache_key)
+        if cached is not None:
+            logger.info("要約キャッシュヒット")
+            return cached
+
         chunks = self._split_into_chunks(transcript)
 
         if len(chunks) == 1:
             logger.info("短いテキスト: 直接要約を実行")
-            return await self._summarize_short(transcript)
+            result = await self._summarize_short(transcript)
         else:
             logger.info("長いテキスト: %d チャンクに分割して要約", len(chunks))
-            return await self._summarize_long(chunks)
+            result = await self._summarize_long(chunks)
+
+        if result.title != PARSE_FAILED_TITLE:
+            _summary_cache.set(cache_key, result)
+        return result
+
+    def _cache_key(self, transcript: str) -> str:
+        """要約結果に影響する設定と字幕テキストからキャッシュキーを作る。"""
+        settings_part = (
+            f"{_PROMPT_FINGERPRINT}|{MODEL_ID}|{MAX_OUTPUT_TOKENS}|"
+            f"{self.chunk_size}|{self.chunk_overlap}|"
+        )
+        return hashlib.blake2b(
+            settings_part.encode() + transcript.encode(),
+            digest_size=16,
+        ).hexdigest()
 
     def _split_into_chunks(self, text: str) -> list[ChunkInfo]:
         """テキストをチャンクに分割する。"""
@@ -191,11 +306,12 @@ class SummarizerService:
 
         chunks: list[str] = []
         start = 0
+        text_length = len(text)
 
-        while start < len(text):
+        while start < text_length:
             end = start + self.chunk_size
 
-            if end >= len(text):
+            if end >= text_length:
                 chunks.append(text[start:])
                 break
 
@@ -214,76 +330,109 @@ class SummarizerService:
 
     @staticmethod
     def _find_split_position(text: str, start: int, end: int) -> int:
-        """自然な区切り位置を探す。"""
+        """自然な区切り位置を探す(部分文字列は切り出さず、範囲指定の rfind で探す)。"""
         search_start = max(start, end - (end - start) // 5)
-        segment = text[search_start:end]
 
-        for delimiter in ["。", "\n\n", "\n", "、", ".", " "]:
-            pos = segment.rfind(delimiter)
+        for delimiter in _SPLIT_DELIMITERS:
+            pos = text.rfind(delimiter, search_start, end)
             if pos != -1:
-                return search_start + pos + len(delimiter)
+                return pos + len(delimiter)
 
         return end
 
     async def _summarize_short(self, transcript: str) -> SummaryResult:
         """短いテキストを直接要約する。"""
-        prompt = SHORT_TEXT_PROMPT.format(transcript=transcript)
+        prompt = _SHORT_TEXT_TEMPLATE.render(transcript=transcript)
         raw = await self._call_api(prompt)
         return self._parse_summary_response(raw, chunk_count=1)
 
     async def _summarize_long(self, chunks: list[ChunkInfo]) -> SummaryResult:
         """長いテキストをチャンク分割パイプラインで要約する。"""
-        partial_summaries: list[str] = []
-        for chunk in chunks:
+        # 各チャンクの要約は互いに独立しているため並行に呼び出す
+        # (同時実行数は _call_api のリミッターで全リクエスト共通に絞られる)
+        async def summarize_chunk(chunk: ChunkInfo) -> str:
             logger.info("チャンク %d/%d を要約中...", chunk.part_number, chunk.total_parts)
-            prompt = CHUNK_SUMMARY_PROMPT.format(
+            prompt = _CHUNK_SUMMARY_TEMPLATE.render(
                 part_number=chunk.part_number,
                 total_parts=chunk.total_parts,
                 chunk=chunk.text,
             )
-            result = await self._call_api(prompt)
-            partial_summaries.append(f"【パート {chunk.part_number}】\n{result}")
+            return await self._call_api(prompt)
+
+        # 1チャンクでも失敗したら残りの呼び出しはキャンセルし、課金され続けないようにする
+        try:
+            async with asyncio.TaskGroup() as tg:
+                tasks = [tg.create_task(summarize_chunk(chunk)) for chunk in chunks]
+        except ExceptionGroup as eg:
+            # 呼び出し側には gather と同じく最初の例外をそのまま送出する
+            raise eg.exceptions[0] from None
+        # タスクはパート順に作成しているので、結果もパート順に並ぶ
+        results = [task.result() for task in tasks]
 
         logger.info("部分要約を統合中...")
-        combined = "\n\n".join(partial_summaries)
-        prompt = FINAL_SUMMARY_PROMPT.format(partial_summaries=combined)
+        partial_summaries = "\n\n".join(
+            f"【パート {chunk.part_number}】\n{result}" for chunk, result in zip(chunks, results)
+        )
+        prompt = _FINAL_SUMMARY_TEMPLATE.render(partial_summaries=partial_summaries)
         raw = await self._call_api(prompt)
         return self._parse_summary_response(raw, chunk_count=len(chunks))
 
     async def _call_api(self, prompt: str) -> str:
-        """Groq API を呼び出す。"""
-        chat_completion = await self.client.chat.completions.create(
-            messages=[{"role": "user", "content": prompt}],
-            model=MODEL_ID,
-            max_completion_tokens=MAX_OUTPUT_TOKENS,
-        )
+        """Groq API を呼び出す(同時実行数はプロセス内の全リクエストで共有して制限する)。"""
+        async with _get_api_limiter():
+            chat_completion = await self.client.chat.completions.create(
+                messages=[{"role": "user", "content": prompt}],
+                model=MODEL_ID,
+                max_completion_tokens=MAX_OUTPUT_TOKENS,
+            )
         return chat_completion.choices[0].message.content or ""
 
     @staticmethod
     def _parse_summary_response(raw: str, chunk_count: int) -> SummaryResult:
         """APIレスポンスのJSON文字列をパースして SummaryResult に変換する。"""
-        import json
-
         text = raw.strip()
 
+        # ```json ... ``` で囲まれている場合は、行に分割せず先頭行と末尾のフェンスだけを取り除く
         if text.startswith("```"):
-            lines = text.split("\n")
-            lines = [l for l in lines[1:] if not l.strip().startswith("```")]
-            text = "\n".join(lines)
+            body_start = text.find("\n") + 1
+            body_end = text.rfind("```")
+            if body_end < body_start:
+                body_end = len(text)
+            text = text[body_start:body_end].strip()
 
         try:
-            data = json.loads(text)
-        except json.JSONDecodeError:
+            data = orjson.loads(text)
+        except orjson.JSONDecodeError:
             logger.warning("JSONパースに失敗しました。フォールバック値を使用します。")
-            return SummaryResult(
-                title="要約の生成に部分的に成功",
-                summary=raw[:500],
-                key_points=[KeyPointItem("要約結果のパースに失敗しました。生テキストを確認してください。")],
-                topics=[],
-                chunk_count=chunk_count,
-            )
+            return SummarizerService._parse_failed_result(raw, chunk_count)
 
+        result = SummarizerService._build_summary(data, chunk_count)
+        if result is None:
+            # 型の合わない結果はレスポンス生成で失敗し、キャッシュされると再試行も同じ失敗になるため、
+            # パース失敗と同じくキャッシュしないフォールバック値にする
+            logger.warning("要約結果の型が不正です。フォールバック値を使用します。")
+            return SummarizerService._parse_failed_result(raw, chunk_count)
+        return result
+
+    @staticmethod
+    def _build_summary(data: object, chunk_count: int) -> SummaryResult | None:
+        """パース済みJSONから SummaryResult を組み立てる(型が合わなければ None)。"""
+        if not isinstance(data, dict):
+            return None
+
+        title = data.get("title", "タイトル不明")
+        summary = data.get("summary", "")
+        topics = data.get("topics", [])
         raw_kps = data.get("key_points", [])
+        if not (
+            isinstance(title, str)
+            and isinstance(summary, str)
+            and isinstance(topics, list)
+            and all(isinstance(topic, str) for topic in topics)
+            and isinstance(raw_kps, list)
+        ):
+            return None
+
         key_points: list[KeyPointItem] = []
         for item in raw_kps:
             if isinstance(item, str):
@@ -291,16 +440,32 @@ class SummarizerService:
             elif isinstance(item, dict):
                 text_val = item.get("text", "")
                 sec = item.get("start_seconds")
+                if not isinstance(text_val, str):
+                    return None
                 if sec is not None and not isinstance(sec, int):
-                    sec = int(sec) if sec is not None else None
+                    try:
+                        sec = int(sec)
+                    except (TypeError, ValueError):
+                        return None
                 key_points.append(KeyPointItem(text=text_val, start_seconds=sec))
             else:
                 key_points.append(KeyPointItem(text=str(item), start_seconds=None))
 
         return SummaryResult(
-            title=data.get("title", "タイトル不明"),
-            summary=data.get("summary", ""),
-            key_points=key_points,
-            topics=data.get("topics", []),
+            title=title,
+            summary=summary,
+            key_points=tuple(key_points),
+            topics=tuple(topics),
+            chunk_count=chunk_count,
+        )
+
+    @staticmethod
+    def _parse_failed_result(raw: str, chunk_count: int) -> SummaryResult:
+        """パースに失敗した場合のフォールバック結果(キャッシュしない)。"""
+        return SummaryResult(
+            title=PARSE_FAILED_TITLE,
+            summary=raw[:500],
+            key_points=(KeyPointItem("要約結果のパースに失敗しました。生テキストを確認してください。"),),
+            topics=(),
             chunk_count=chunk_count,
         )
@@ -2,39 +2,67 @@
 API エンドポイントのテスト
 """
 
+from types import SimpleNamespace
 from unittest.mock import AsyncMock, patch
 
 import pytest
 from fastapi.testclient import TestClient
 
 from app.main import app
+from app.models.schemas import SummarizeRequest, TranscriptResult
+from app.routers.summarize import get_groq_client
+from app.services import summarizer
+from app.services.summarizer import KeyPointItem, SummaryResult
 from app.services.youtube import YouTubeTranscriptError
 
-client = TestClient(app)
+
+@pytest.fixture(scope="session")
+def client():
+    """全テストで共有する TestClient(lifespan は起動しない)"""
+    test_client = TestClient(app)
+    yield test_client
+    test_client.close()
 
 
 class TestHealth:
     """ヘルスチェックのテスト"""
 
-    def test_health_returns_200(self):
+    def test_health_returns_200(self, client):
         """GET /health が 200 と status: ok を返す"""
         response = client.get("/health")
         assert response.status_code == 200
         assert response.json() == {"status": "ok"}
 
 
+class TestSummarizeRequest:
+    """要約リクエストスキーマのテスト"""
+
+    def test_video_id_extracted_on_validation(self):
+        """バリデーション時に動画IDが抽出される"""
+        request = SummarizeRequest(url="https://youtu.be/dQw4w9WgXcQ")
+        assert request.video_id == "dQw4w9WgXcQ"
+
+    def test_video_id_not_in_dump(self):
+        """動画IDはリクエストのフィールドとして公開されない"""
+        request = SummarizeRequest(url="https://www.youtube.com/shorts/dQw4w9WgXcQ")
+        assert "video_id" not in request.model_dump()
+
+
 class TestSummarize:
     """要約APIのテスト"""
 
-    def test_summarize_invalid_url_returns_422(self):
+    def test_summarize_invalid_url_returns_422(self, client):
         """無効なURLで 422 バリデーションエラーになる"""
         response = client.post(
             "/api/summarize",
             json={"url": "https://example.com/not-youtube"},
         )
         assert response.status_code == 422
+        error = response.json()["detail"][0]
+        assert error["loc"] == ["body", "url"]
+        assert error["input"] == "https://example.com/not-youtube"
 
-    def test_summarize_missing_url_returns_422(self):
+    def test_summarize_missing_url_returns_422(self, client):
         """url なしで 422 になる"""
         response = client.post(
             "/api/summarize",
@@ -43,7 +71,7 @@ class TestSummarize:
         assert response.status_code == 422
 
     @patch("app.routers.summarize.fetch_transcript", new_callable=AsyncMock)
-    def test_summarize_no_transcript_returns_404(self, mock_fetch):
+    def test_summarize_no_transcript_returns_404(self, mock_fetch, client):
         """字幕がない場合 404 と detail を返す"""
         mock_fetch.side_effect = YouTubeTranscriptError(
             "この動画には利用可能な字幕がありません",
@@ -57,3 +85,103 @@ class TestSummarize:
         body = response.json()
         assert "detail" in body
         assert body["detail"]["error_code"] == "NO_TRANSCRIPT"
+        mock_fetch.assert_awaited_once_with(video_id="dQw4w9WgXcQ", language="ja")
+
+    @patch("app.routers.summarize.SummarizerService")
+    @patch("app.routers.summarize.fetch_transcript", new_callable=AsyncMock)
+    def test_summarize_success_uses_shared_client(self, mock_fetch, MockService, client):
+        """共有 Groq クライアントで要約し、200 とレスポンスを返す"""
+        mock_fetch.return_value = TranscriptResult(
+            video_id="dQw4w9WgXcQ",
+            language="ja",
+            timestamped_text="[0] こんにちは\n",
+            transcript_length=5,
+        )
+        MockService.return_value.summarize_transcript = AsyncMock(
+            return_value=SummaryResult(
+                title="タイトル",
+                summary="要約",
+                key_points=(KeyPointItem(text="ポイント", start_seconds=0),),
+                topics=("トピック",),
+            )
+        )
+        shared_client = object()
+        app.dependency_overrides[get_groq_client] = lambda: shared_client
+        try:
+            response = client.post(
+                "/api/summarize",
+                json={"url": "https://www.youtube.com/watch?v=dQw4w9WgXcQ", "language": "ja"},
+            )
+        finally:
+            app.dependency_overrides.clear()
+
+        assert response.status_code == 200
+        MockService.assert_called_once_with(client=shared_client)
+        body = response.json()
+        assert body["video_id"] == "dQw4w9WgXcQ"
+        assert body["key_points"] == [{"text": "ポイント", "start_seconds": 0}]
+        assert body["transcript_length"] == 5
+
+    @patch("app.routers.summarize.SummarizerService")
+    @patch("app.routers.summarize.fetch_transcript", new_callable=AsyncMock)
+    def test_summarize_malformed_summary_returns_500(self, mock_fetch, MockService, client):
+        """LLM の応答が型に合わない場合は 200 ではなく 500 を返す"""
+        mock_fetch.return_value = TranscriptResult(
+            video_id="dQw4w9WgXcQ",
+            language="ja",
+            timestamped_text="[0] こんにちは\n",
+            transcript_length=5,
+        )
+        MockService.return_value.summarize_transcript = AsyncMock(
+            return_value=SummaryResult(
+                title=None,
+                summary=5,
+                key_points=(KeyPointItem(text=None, start_seconds="x"),),
+                topics=(1, None),
+            )
+        )
+        response = client.post(
+            "/api/summarize",
+            json={"url": "https://www.youtube.com/watch?v=dQw4w9WgXcQ", "language": "ja"},
+        )
+
+        assert response.status_code == 500
+        assert response.json()["detail"]["error_code"] == "SUMMARIZE_FAILED"
+
+    @patch("app.routers.summarize.fetch_transcript", new_callable=AsyncMock)
+    def test_malformed_summary_is_not_cached(self, mock_fetch, client):
+        """型の合わない応答はキャッシュされず、次のリクエストで API を呼び直して 200 を返す"""
+        mock_fetch.return_value = TranscriptResult(
+            video_id="dQw4w9WgXcQ",
+            language="ja",
+            timestamped_text="[0] キャッシュ確認用の字幕\n",
+            transcript_length=11,
+        )
+        replies = iter(
+            [
+                '{"title": null, "summary": "s", "key_points": [], "topics": "x"}',
+                '{"title": "タイトル", "summary": "要約", "key_points": [], "topics": ["トピック"]}',
+            ]
+        )
+        calls = 0
+
+        async def fake_create(**kwargs):
+            nonlocal calls
+            calls += 1
+            content = next(replies)
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+        groq_client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=fake_create)))
+        app.dependency_overrides[get_groq_client] = lambda: groq_client
+        summarizer._summary_cache.clear()
+        try:
+            payload = {"url": "https://www.youtube.com/watch?v=dQw4w9WgXcQ", "language": "ja"}
+            client.post("/api/summarize", json=payload)
+            response = client.post("/api/summarize", json=payload)
+        finally:
+            app.dependency_overrides.clear()
+            summarizer._summary_cache.clear()
+
+        assert calls == 2
+        assert response.status_code == 200
+        assert response.json()["title"] == "タイトル"
@@ -0,0 +1,38 @@
+"""
+プロセス内キャッシュのテスト
+"""
+
+from unittest.mock import patch
+
+from app.services.cache import TTLCache
+
+
+class TestTTLCache:
+    """TTL 付き LRU キャッシュのテスト"""
+
+    def test_get_returns_stored_value(self):
+        """登録した値を取得できる"""
+        cache: TTLCache[str, int] = TTLCache(maxsize=2, ttl=60)
+        cache.set("a", 1)
+        assert cache.get("a") == 1
+        assert cache.get("missing") is None
+
+    def test_expired_entry_is_dropped(self):
+        """有効期限を過ぎたエントリは None を返して破棄される"""
+        cache: TTLCache[str, int] = TTLCache(maxsize=2, ttl=60)
+        with patch("app.services.cache.time.monotonic", return_value=100.0):
+            cache.set("a", 1)
+        with patch("app.services.cache.time.monotonic", return_value=161.0):
+            assert cache.get("a") is None
+        assert len(cache) == 0
+
+    def test_least_recently_used_is_evicted(self):
+        """上限を超えると最も参照されていないエントリから破棄される"""
+        cache: TTLCache[str, int] = TTLCache(maxsize=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        assert cache.get("c") == 3
@@ -0,0 +1,63 @@
+"""
+アプリケーション設定のテスト
+"""
+
+from unittest.mock import patch
+
+import pytest
+
+from app import config
+from app.config import Settings, get_settings, load_env
+
+
+@pytest.fixture
+def clean_env(monkeypatch):
+    """設定に関わる環境変数を未設定の状態にする"""
+    for name in ("GROQ_API_KEY", "CORS_ORIGINS", "YOUTUBE_PROXY_URL"):
+        monkeypatch.delenv(name, raising=False)
+
+
+class TestLoadEnv:
+    """.env 読み込みのテスト"""
+
+    def test_loads_only_once(self, monkeypatch):
+        """2回目以降の呼び出しでは .env を読み直さない"""
+        monkeypatch.setattr(config, "_loaded", False)
+        with patch("app.config.load_dotenv") as mock_load:
+            load_env()
+            load_env()
+        mock_load.assert_called_once_with(config._ENV_PATH)
+
+
+class TestGetSettings:
+    """設定取得のテスト"""
+
+    def test_returns_cached_instance(self):
+        """2回目以降は同じインスタンスを返す"""
+        assert get_settings() is get_settings()
+
+
+class TestSettings:
+    """環境変数からの設定組み立てのテスト"""
+
+    def test_cors_blank_entries_are_dropped(self, clean_env, monkeypatch):
+        """CORS_ORIGINS の空要素と前後の空白は取り除く"""
+        monkeypatch.setenv("CORS_ORIGINS", " https://a.example , ,\nhttps://b.example,")
+        assert Settings().allow_origins_list == ["https://a.example", "https://b.example"]
+
+    @pytest.mark.parametrize("value", [None, "", " , ,"])
+    def test_cors_falls_back_to_wildcard(self, clean_env, monkeypatch, value):
+        """CORS_ORIGINS が未設定・空なら * を許可する"""
+        if value is not None:
+            monkeypatch.setenv("CORS_ORIGINS", value)
+        assert Settings().allow_origins_list == ["*"]
+
+    def test_blank_proxy_url_is_none(self, clean_env, monkeypatch):
+        """空白だけの YOUTUBE_PROXY_URL はプロキシなしとして扱う"""
+        monkeypatch.setenv("YOUTUBE_PROXY_URL", "  \n")
+        assert Settings().youtube_proxy_url is None
+
+    def test_proxy_url_is_stripped(self, clean_env, monkeypatch):
+        """YOUTUBE_PROXY_URL の前後の空白は取り除く"""
+        monkeypatch.setenv("YOUTUBE_PROXY_URL", " http://proxy.example.com:8080 ")
+        assert Settings().youtube_proxy_url == "http://proxy.example.com:8080"
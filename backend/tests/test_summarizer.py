@@ -0,0 +1,273 @@
+"""
+要約サービスのテスト
+"""
+
+import asyncio
+import re
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import summarizer
+from app.services.summarizer import MAX_CONCURRENT_API_CALLS, SummarizerService
+
+
+@pytest.fixture(autouse=True)
+def clear_summary_cache():
+    """テスト間で要約キャッシュを共有しない"""
+    summarizer._summary_cache.clear()
+    yield
+    summarizer._summary_cache.clear()
+
+
+def _make_service(**kwargs) -> SummarizerService:
+    """ダミーのAPIキーでサービスを生成する"""
+    return SummarizerService(api_key="test-key", **kwargs)
+
+
+def _fake_client(create) -> SimpleNamespace:
+    """chat.completions.create だけを持つ AsyncGroq のフェイク"""
+    return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+
+def _completion(content: str) -> SimpleNamespace:
+    """chat.completions.create の戻り値のフェイク"""
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+class TestPromptTemplate:
+    """プロンプトテンプレートのテスト"""
+
+    def test_render_matches_str_format(self):
+        """事前分解したテンプレートの出力が str.format と一致する"""
+        values = {
+            "part_number": 2,
+            "total_parts": 3,
+            "chunk": "字幕 {括弧} を含む",
+            "partial_summaries": "要約",
+            "transcript": "[0] こんにちは",
+        }
+        for template in (
+            summarizer.CHUNK_SUMMARY_PROMPT,
+            summarizer.FINAL_SUMMARY_PROMPT,
+            summarizer.SHORT_TEXT_PROMPT,
+        ):
+            expected = template.format(**values)
+            assert summarizer._PromptTemplate(template).render(**values) == expected
+
+
+class TestSplitIntoChunks:
+    """チャンク分割のテスト"""
+
+    def test_default_chunk_fits_model_context(self):
+        """既定のチャンクは最大見積もりのトークン数でもプロンプト・出力と合わせてコンテキストに収まる"""
+        longest_prompt = max(
+            len(p)
+            for p in (summarizer.CHUNK_SUMMARY_PROMPT, summarizer.FINAL_SUMMARY_PROMPT, summarizer.SHORT_TEXT_PROMPT)
+        )
+        assert longest_prompt * summarizer.TOKENS_PER_CHAR <= summarizer.PROMPT_OVERHEAD_TOKENS
+        used = (
+            summarizer.DEFAULT_CHUNK_SIZE * summarizer.TOKENS_PER_CHAR
+            + summarizer.PROMPT_OVERHEAD_TOKENS
+            + summarizer.MAX_OUTPUT_TOKENS
+        )
+        assert used <= summarizer.MODEL_CONTEXT_TOKENS
+
+    def test_short_text_is_single_chunk(self):
+        """チャンクサイズ以下のテキストは分割しない"""
+        service = _make_service(chunk_size=100)
+        chunks = service._split_into_chunks("あ" * 100)
+        assert len(chunks) == 1
+        assert chunks[0].total_parts == 1
+
+    def test_split_at_sentence_end_within_window(self):
+        """探索範囲内の最後の句点の直後で分割する"""
+        service = _make_service(chunk_size=100, chunk_overlap=0)
+        text = "あ" * 85 + "。" + "い" * 50
+        chunks = service._split_into_chunks(text)
+        assert chunks[0].text == "あ" * 85 + "。"
+        assert chunks[1].text == "い" * 50
+        assert [c.part_number for c in chunks] == [1, 2]
+        assert all(c.total_parts == 2 for c in chunks)
+
+    def test_delimiter_before_window_is_ignored(self):
+        """探索範囲(末尾20%)より前の区切り文字では分割しない"""
+        service = _make_service(chunk_size=100, chunk_overlap=0)
+        text = "あ" * 10 + "。" + "い" * 150
+        chunks = service._split_into_chunks(text)
+        assert len(chunks[0].text) == 100
+
+
+class TestSummarizeLong:
+    """チャンク分割パイプラインのテスト"""
+
+    @pytest.mark.asyncio
+    async def test_partial_summaries_keep_part_order(self):
+        """並行実行しても部分要約はパート順に統合される"""
+        service = _make_service(chunk_size=100, chunk_overlap=10)
+        chunks = service._split_into_chunks("あ" * 350)
+        prompts: list[str] = []
+
+        async def fake_call_api(prompt: str) -> str:
+            prompts.append(prompt)
+            if "<partial_summaries>" in prompt:
+                return '{"title": "t", "summary": "s", "key_points": [], "topics": []}'
+            # 前のパートほど遅く返し、完了順とパート順をずらす
+            part = int(re.search(r"パート (\d+)/", prompt).group(1))
+            await asyncio.sleep(0.01 * (len(chunks) - part))
+            return f"summary-{part}"
+
+        service._call_api = fake_call_api
+        result = await service._summarize_long(chunks)
+
+        final_prompt = prompts[-1]
+        positions = [final_prompt.index(f"summary-{c.part_number}") for c in chunks]
+        assert positions == sorted(positions)
+        assert result.chunk_count == len(chunks)
+
+    @pytest.mark.asyncio
+    async def test_concurrency_is_bounded_across_requests(self):
+        """複数リクエストが同時に走っても、API の同時呼び出しは上限以内に収まる"""
+        running = 0
+        peak = 0
+
+        async def fake_create(messages, **kwargs):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            if "<partial_summaries>" in messages[0]["content"]:
+                return _completion("{}")
+            return _completion("summary")
+
+        services = [
+            _make_service(chunk_size=100, chunk_overlap=10, client=_fake_client(fake_create))
+            for _ in range(2)
+        ]
+        chunks = services[0]._split_into_chunks("あ" * 1000)
+        assert len(chunks) > MAX_CONCURRENT_API_CALLS
+        await asyncio.gather(*(service._summarize_long(chunks) for service in services))
+
+        assert peak == MAX_CONCURRENT_API_CALLS
+
+    @pytest.mark.asyncio
+    async def test_failed_chunk_cancels_siblings(self):
+        """1チャンクが失敗すると残りのチャンク要約はキャンセルされ、元の例外が送出される"""
+        service = _make_service(chunk_size=100, chunk_overlap=10)
+        chunks = service._split_into_chunks("あ" * 350)
+        completed = 0
+
+        async def fake_call_api(prompt: str) -> str:
+            nonlocal completed
+            if "パート 1/" in prompt:
+                raise RuntimeError("API error")
+            await asyncio.sleep(0.05)
+            completed += 1
+            return "summary"
+
+        service._call_api = fake_call_api
+        with pytest.raises(RuntimeError, match="API error"):
+            await service._summarize_long(chunks)
+        await asyncio.sleep(0.1)
+
+        assert completed == 0
+
+
+class TestSummaryCache:
+    """要約結果キャッシュのテスト"""
+
+    @pytest.mark.asyncio
+    async def test_same_transcript_is_served_from_cache(self):
+        """同じ字幕テキストの2回目はAPIを呼ばない"""
+        service = _make_service()
+        calls = 0
+
+        async def fake_call_api(prompt: str) -> str:
+            nonlocal calls
+            calls += 1
+            return '{"title": "t", "summary": "s", "key_points": [], "topics": []}'
+
+        service._call_api = fake_call_api
+        first = await service.summarize_transcript("[0] こんにちは")
+        second = await service.summarize_transcript("[0] こんにちは\n")
+
+        assert second is first
+        assert calls == 1
+
+    @pytest.mark.asyncio
+    async def test_cached_result_is_immutable(self):
+        """キャッシュ済みの結果はキーポイント・トピックを含めて書き換えられない"""
+        service = _make_service()
+
+        async def fake_call_api(prompt: str) -> str:
+            return '{"title": "t", "summary": "s", "key_points": ["p"], "topics": ["a"]}'
+
+        service._call_api = fake_call_api
+        result = await service.summarize_transcript("[0] こんにちは")
+
+        with pytest.raises(AttributeError):
+            result.topics.append("b")
+        with pytest.raises(AttributeError):
+            result.key_points.append(summarizer.KeyPointItem("q"))
+        assert (await service.summarize_transcript("[0] こんにちは")).topics == ("a",)
+
+    @pytest.mark.asyncio
+    async def test_parse_failure_is_not_cached(self):
+        """JSONパースに失敗した結果はキャッシュしない"""
+        service = _make_service()
+        calls = 0
+
+        async def fake_call_api(prompt: str) -> str:
+            nonlocal calls
+            calls += 1
+            return "not json"
+
+        service._call_api = fake_call_api
+        await service.summarize_transcript("[0] こんにちは")
+        await service.summarize_transcript("[0] こんにちは")
+
+        assert calls == 2
+
+
+class TestParseSummaryResponse:
+    """APIレスポンスのパースのテスト"""
+
+    def test_plain_json(self):
+        """JSONのみのレスポンスをパースできる"""
+        raw = '{"title": "t", "summary": "s", "key_points": [{"text": "p", "start_seconds": 12}], "topics": ["a"]}'
+        result = SummarizerService._parse_summary_response(raw, chunk_count=1)
+        assert result.title == "t"
+        assert result.key_points[0].text == "p"
+        assert result.key_points[0].start_seconds == 12
+        assert result.topics == ("a",)
+
+    def test_fenced_json(self):
+        """コードフェンスで囲まれたJSONをパースできる"""
+        raw = '```json\n{"title": "t", "summary": "s", "key_points": ["p"], "topics": []}\n```'
+        result = SummarizerService._parse_summary_response(raw, chunk_count=2)
+        assert result.title == "t"
+        assert result.key_points[0].text == "p"
+        assert result.chunk_count == 2
+
+    @pytest.mark.parametrize(
+        "raw",
+        [
+            '{"title": null, "summary": "s", "key_points": [], "topics": []}',
+            '{"title": "t", "summary": 5, "key_points": [], "topics": []}',
+            '{"title": "t", "summary": "s", "key_points": [], "topics": "x"}',
+            '{"title": "t", "summary": "s", "key_points": [], "topics": [1, null]}',
+            '{"title": "t", "summary": "s", "key_points": [{"text": null}], "topics": []}',
+            '{"title": "t", "summary": "s", "key_points": [{"text": "p", "start_seconds": "x"}], "topics": []}',
+            '["not", "an", "object"]',
+        ],
+    )
+    def test_wrong_types_fall_back(self, raw):
+        """JSONとして読めても型が合わない場合はフォールバック値を返す"""
+        result = SummarizerService._parse_summary_response(raw, chunk_count=1)
+        assert result.title == summarizer.PARSE_FAILED_TITLE
+
+    def test_invalid_json_falls_back(self):
+        """JSONでない場合はフォールバック値を返す"""
+        result = SummarizerService._parse_summary_response("```\nnot json", chunk_count=1)
+        assert result.title == summarizer.PARSE_FAILED_TITLE
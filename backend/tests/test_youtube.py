@@ -2,11 +2,73 @@
 YouTube字幕取得サービスのテスト
 """
 
+import asyncio
+import copy
+import pickle
+import threading
+from types import SimpleNamespace
+
 import pytest
-from unittest.mock import patch, MagicMock
+import requests
+from tenacity import wait_none
+from unittest.mock import patch
+from youtube_transcript_api import IpBlocked, YouTubeRequestFailed
+
+from app.services import youtube
 from app.services.youtube import extract_video_id, fetch_transcript, YouTubeTranscriptError
 
 
+def _entry(text: str = "こんにちは", start: float = 0.0, duration: float = 2.5) -> SimpleNamespace:
+    """字幕エントリ(FetchedTranscriptSnippet 相当)"""
+    return SimpleNamespace(text=text, start=start, duration=duration)
+
+
+class FakeTranscript:
+    """fetch / translate だけを持つ Transcript のフェイク"""
+
+    def __init__(self, entries=(), translatable: bool = True):
+        self.entries = list(entries)
+        self.translatable = translatable
+        self.translated_to: list[str] = []
+
+    def fetch(self):
+        return self.entries
+
+    def translate(self, language_code: str) -> "FakeTranscript":
+        if not self.translatable:
+            raise Exception("not translatable")
+        self.translated_to.append(language_code)
+        return FakeTranscript(self.entries)
+
+
+class FakeTranscriptList:
+    """言語コード→字幕の辞書を持つ TranscriptList のフェイク"""
+
+    def __init__(self, manual: dict | None = None, generated: dict | None = None):
+        self._manually_created_transcripts = manual or {}
+        self._generated_transcripts = generated or {}
+
+
+class FakeYttApi:
+    """list の呼び出し回数を数える YouTubeTranscriptApi のフェイク"""
+
+    def __init__(self, transcript_list: FakeTranscriptList):
+        self.transcript_list = transcript_list
+        self.list_calls = 0
+
+    def list(self, video_id: str) -> FakeTranscriptList:
+        self.list_calls += 1
+        return self.transcript_list
+
+
+@pytest.fixture(autouse=True)
+def clear_transcript_cache():
+    """テスト間で字幕キャッシュを共有しない"""
+    youtube._transcript_cache.clear()
+    yield
+    youtube._transcript_cache.clear()
+
+
 class TestExtractVideoId:
     """動画ID抽出のテスト"""
 
@@ -35,6 +97,22 @@ class TestExtractVideoId:
         url = "https://youtube.com/watch?v=dQw4w9WgXcQ"
         assert extract_video_id(url) == "dQw4w9WgXcQ"
 
+    def test_skips_invalid_candidate(self):
+        """最初の一致箇所が動画IDとして不正でも、後続の一致から抽出できる"""
+        url = "https://www.youtube.com/watch?v=bad!&next=https://youtu.be/dQw4w9WgXcQ"
+        assert extract_video_id(url) == "dQw4w9WgXcQ"
+
+    def test_too_short_id_raises_error(self):
+        """11文字に満たないIDはエラーになる"""
+        with pytest.raises(YouTubeTranscriptError):
+            extract_video_id("https://youtu.be/dQw4w9")
+
+    def test_bytes_url(self):
+        """bytes のURLからも str の動画IDを抽出できる"""
+        assert extract_video_id(b"https://youtu.be/dQw4w9WgXcQ") == "dQw4w9WgXcQ"
+        with pytest.raises(YouTubeTranscriptError):
+            extract_video_id(b"https://example.com/video")
+
     def test_invalid_url_raises_error(self):
         """無効なURLでエラーが発生する"""
         with pytest.raises(YouTubeTranscriptError) as exc_info:
@@ -53,61 +131,354 @@ class TestFetchTranscript:
     @pytest.mark.asyncio
     async def test_fetch_transcript_success(self):
         """正常に字幕を取得できる"""
-        # モックの字幕データ
-        mock_entry = MagicMock()
-        mock_entry.text = "こんにちは"
-        mock_entry.start = 0.0
-        mock_entry.duration = 2.5
-        mock_transcript_data = [mock_entry]
-
-        mock_transcript = MagicMock()
-        mock_transcript.fetch.return_value = mock_transcript_data
+        api = FakeYttApi(FakeTranscriptList(manual={"ja": FakeTranscript([_entry()])}))
 
-        mock_transcript_list = MagicMock()
-        mock_transcript_list.find_transcript.return_value = mock_transcript
-
-        with patch(
-            "app.services.youtube.YouTubeTranscriptApi",
-        ) as MockApi, patch(
-            "app.services.youtube.TextFormatter.format_transcript",
-            return_value="こんにちは",
-        ):
-            MockApi.return_value.list.return_value = mock_transcript_list
+        with patch("app.services.youtube._get_ytt_api", return_value=api):
             result = await fetch_transcript(
-                url="https://www.youtube.com/watch?v=dQw4w9WgXcQ",
+                video_id="dQw4w9WgXcQ",
                 language="ja",
             )
 
         assert result.video_id == "dQw4w9WgXcQ"
         assert result.language == "ja"
-        assert len(result.segments) == 1
-        assert result.segments[0].text == "こんにちは"
-        assert result.full_text == "こんにちは"
+        assert result.timestamped_text == "[0] こんにちは\n"
+        assert result.transcript_length == len("こんにちは")
+
+    @pytest.mark.asyncio
+    async def test_fetch_transcript_uses_cache(self):
+        """同じ動画・言語の2回目の取得では YouTube に問い合わせない"""
+        api = FakeYttApi(FakeTranscriptList(manual={"ja": FakeTranscript([_entry()])}))
+
+        with patch("app.services.youtube._get_ytt_api", return_value=api):
+            first = await fetch_transcript(video_id="dQw4w9WgXcQ", language="ja")
+            second = await fetch_transcript(video_id="dQw4w9WgXcQ", language="ja")
+
+        assert second is first
+        assert api.list_calls == 1
+
+    @pytest.mark.asyncio
+    async def test_concurrent_fetches_are_coalesced(self):
+        """同じ動画への同時リクエストは1回の取得にまとめられる"""
+        async def slow_fetch(video_id, language):
+            await asyncio.sleep(0.01)
+            return [_entry()]
+
+        with patch(
+            "app.services.youtube.fetch_transcript_raw",
+            side_effect=slow_fetch,
+        ) as mock_raw:
+            results = await asyncio.gather(
+                *(fetch_transcript(video_id="dQw4w9WgXcQ", language="ja") for _ in range(3))
+            )
+
+        assert mock_raw.call_count == 1
+        assert all(r is results[0] for r in results)
+        assert youtube._inflight_transcripts == {}
+
+    @pytest.mark.asyncio
+    async def test_concurrent_failure_is_shared(self):
+        """同時リクエスト中の失敗は1回の取得で全員に同じ例外として返り、キャッシュされない"""
+        error = YouTubeTranscriptError("字幕がありません", error_code="NO_TRANSCRIPT")
+
+        async def failing_fetch(video_id, language):
+            await asyncio.sleep(0.01)
+            raise error
+
+        with patch(
+            "app.services.youtube.fetch_transcript_raw",
+            side_effect=failing_fetch,
+        ) as mock_raw:
+            results = await asyncio.gather(
+                *(fetch_transcript(video_id="dQw4w9WgXcQ", language="ja") for _ in range(5)),
+                return_exceptions=True,
+            )
+            assert mock_raw.call_count == 1
+            assert all(r is error for r in results)
+            assert youtube._inflight_transcripts == {}
+
+            # 失敗はキャッシュしないため、次のリクエストは改めて取得する
+            with pytest.raises(YouTubeTranscriptError):
+                await fetch_transcript(video_id="dQw4w9WgXcQ", language="ja")
+            assert mock_raw.call_count == 2
+
+    @pytest.mark.asyncio
+    async def test_cancelled_waiter_does_not_cancel_fetch(self):
+        """待ち手の1件がキャンセルされても、他の待ち手は取得結果を受け取る"""
+        async def slow_fetch(video_id, language):
+            await asyncio.sleep(0.01)
+            return [_entry()]
+
+        with patch("app.services.youtube.fetch_transcript_raw", side_effect=slow_fetch):
+            first = asyncio.ensure_future(fetch_transcript(video_id="dQw4w9WgXcQ", language="ja"))
+            second = asyncio.ensure_future(fetch_transcript(video_id="dQw4w9WgXcQ", language="ja"))
+            await asyncio.sleep(0)
+            first.cancel()
+            result = await second
+
+        assert first.cancelled()
+        assert result.timestamped_text == "[0] こんにちは\n"
+
+    @pytest.mark.asyncio
+    async def test_blocking_fetch_runs_off_event_loop(self):
+        """同期的な字幕取得はイベントループとは別スレッドで実行される"""
+        loop_thread = threading.get_ident()
+        fetch_threads: list[int] = []
+
+        def fake_fetch_sync(video_id, language):
+            fetch_threads.append(threading.get_ident())
+            return []
+
+        with patch("app.services.youtube._fetch_sync", side_effect=fake_fetch_sync):
+            await youtube.fetch_transcript_raw("dQw4w9WgXcQ", "ja")
+
+        assert fetch_threads and fetch_threads[0] != loop_thread
 
     @pytest.mark.asyncio
     async def test_fetch_transcript_no_subtitles(self):
         """字幕が存在しない場合にエラーが発生する"""
-        mock_transcript_list = MagicMock()
-        mock_transcript_list.find_transcript.side_effect = Exception("Not found")
-        mock_transcript_list.find_generated_transcript.side_effect = Exception("Not found")
+        api = FakeYttApi(FakeTranscriptList())
 
-        with patch(
-            "app.services.youtube.YouTubeTranscriptApi",
-        ) as MockApi:
-            MockApi.return_value.list.return_value = mock_transcript_list
+        with patch("app.services.youtube._get_ytt_api", return_value=api):
             with pytest.raises(YouTubeTranscriptError) as exc_info:
                 await fetch_transcript(
-                    url="https://www.youtube.com/watch?v=dQw4w9WgXcQ",
+                    video_id="dQw4w9WgXcQ",
                     language="ja",
                 )
             assert exc_info.value.error_code in ("NO_TRANSCRIPT", "FETCH_FAILED")
 
+
+class TestFetchTranscripts:
+    """複数URLの並行取得のテスト"""
+
     @pytest.mark.asyncio
-    async def test_fetch_transcript_invalid_url(self):
-        """無効なURLでエラーが発生する"""
+    async def test_results_keep_order_and_errors(self):
+        """結果は入力順に並び、失敗したURLの位置には例外が入る"""
+        async def fake_fetch(video_id, language):
+            await asyncio.sleep(0.01 if video_id == "aaaaaaaaaaa" else 0)
+            return video_id
+
+        with patch("app.services.youtube.fetch_transcript", side_effect=fake_fetch):
+            results = await youtube.fetch_transcripts(
+                [
+                    "https://youtu.be/aaaaaaaaaaa",
+                    "https://example.com/video",
+                    "https://youtu.be/bbbbbbbbbbb",
+                ]
+            )
+
+        assert results[0] == "aaaaaaaaaaa"
+        assert isinstance(results[1], YouTubeTranscriptError)
+        assert results[1].error_code == "INVALID_URL"
+        assert results[2] == "bbbbbbbbbbb"
+
+    @pytest.mark.asyncio
+    async def test_concurrency_is_bounded(self):
+        """同時に取得する数は concurrency を超えない"""
+        active = 0
+        peak = 0
+
+        async def fake_fetch(video_id, language):
+            nonlocal active, peak
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.01)
+            active -= 1
+            return video_id
+
+        urls = [f"https://youtu.be/{i:011d}" for i in range(6)]
+        with patch("app.services.youtube.fetch_transcript", side_effect=fake_fetch):
+            results = await youtube.fetch_transcripts(urls, concurrency=2)
+
+        assert peak == 2
+        assert results == [f"{i:011d}" for i in range(6)]
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("concurrency", [0, -1])
+    async def test_invalid_concurrency_raises(self, concurrency):
+        """concurrency が1未満なら取得を始めずに ValueError になる"""
+        with pytest.raises(ValueError, match="concurrency"):
+            await youtube.fetch_transcripts(["https://youtu.be/dQw4w9WgXcQ"], concurrency=concurrency)
+
+
+class TestSelectTranscript:
+    """字幕選択のテスト"""
+
+    def test_manual_preferred_over_generated(self):
+        """指定言語の手動作成字幕を自動生成字幕より優先する"""
+        manual_ja, generated_ja = FakeTranscript(), FakeTranscript()
+        transcript_list = FakeTranscriptList(manual={"ja": manual_ja}, generated={"ja": generated_ja})
+        assert youtube._select_transcript(transcript_list, "ja") is manual_ja
+
+    def test_generated_used_when_no_manual(self):
+        """手動作成字幕がなければ自動生成字幕を使う"""
+        generated_ja = FakeTranscript()
+        transcript_list = FakeTranscriptList(generated={"ja": generated_ja})
+        assert youtube._select_transcript(transcript_list, "ja") is generated_ja
+
+    def test_english_is_translated(self):
+        """指定言語がなければ英語字幕を翻訳して使う"""
+        manual_en = FakeTranscript()
+        transcript_list = FakeTranscriptList(manual={"en": manual_en})
+        selected = youtube._select_transcript(transcript_list, "ja")
+        assert manual_en.translated_to == ["ja"]
+        assert selected is not manual_en
+
+    def test_no_transcript_raises(self):
+        """該当する字幕がなければ NO_TRANSCRIPT になる"""
+        transcript_list = FakeTranscriptList(manual={"fr": FakeTranscript()})
         with pytest.raises(YouTubeTranscriptError) as exc_info:
-            await fetch_transcript(url="https://example.com/video")
-        assert exc_info.value.error_code == "INVALID_URL"
+            youtube._select_transcript(transcript_list, "ja")
+        assert exc_info.value.error_code == "NO_TRANSCRIPT"
+
+    def test_untranslatable_raises(self):
+        """英語字幕が翻訳できなければ NO_TRANSCRIPT になる"""
+        transcript_list = FakeTranscriptList(manual={"en": FakeTranscript(translatable=False)})
+        with pytest.raises(YouTubeTranscriptError) as exc_info:
+            youtube._select_transcript(transcript_list, "ja")
+        assert exc_info.value.error_code == "NO_TRANSCRIPT"
+
+    def test_falls_back_to_find_api(self):
+        """内部の辞書がない TranscriptList では find_* で選択する"""
+        transcript = FakeTranscript()
+
+        def find_transcript(language_codes):
+            if language_codes == ["ja"]:
+                return transcript
+            raise Exception("Not found")
+
+        transcript_list = SimpleNamespace(find_transcript=find_transcript)
+        assert youtube._select_transcript(transcript_list, "ja") is transcript
+
+
+def _request_failed(status_code: int) -> YouTubeRequestFailed:
+    """ライブラリと同じく HTTPError の except 節内で送出した YouTubeRequestFailed を返す"""
+    response = requests.Response()
+    response.status_code = status_code
+    try:
+        try:
+            raise requests.exceptions.HTTPError(f"{status_code} Error", response=response)
+        except requests.exceptions.HTTPError as error:
+            raise YouTubeRequestFailed("dQw4w9WgXcQ", error)
+    except YouTubeRequestFailed as exc:
+        return exc
+
+
+class TestFetchRetry:
+    """字幕取得の再試行のテスト"""
+
+    @pytest.fixture(autouse=True)
+    def no_wait(self):
+        """再試行の待機時間をなくす"""
+        with patch.object(youtube._fetch_with_retry.retry, "wait", wait_none()):
+            yield
+
+    @pytest.mark.asyncio
+    async def test_transient_error_is_retried(self):
+        """通信エラーは再試行され、成功すれば結果を返す"""
+        with patch(
+            "app.services.youtube._fetch_sync",
+            side_effect=[requests.exceptions.ConnectionError("reset"), []],
+        ) as mock_fetch:
+            result = await youtube.fetch_transcript_raw("dQw4w9WgXcQ", "ja")
+
+        assert result == []
+        assert mock_fetch.call_count == 2
+
+    @pytest.mark.asyncio
+    async def test_gives_up_after_max_attempts(self):
+        """再試行回数を超えたら FETCH_FAILED になる"""
+        with patch(
+            "app.services.youtube._fetch_sync",
+            side_effect=requests.exceptions.ConnectionError("reset"),
+        ) as mock_fetch:
+            with pytest.raises(YouTubeTranscriptError) as exc_info:
+                await youtube.fetch_transcript_raw("dQw4w9WgXcQ", "ja")
+
+        assert exc_info.value.error_code == "FETCH_FAILED"
+        assert mock_fetch.call_count == youtube.FETCH_RETRY_ATTEMPTS
+
+    @pytest.mark.asyncio
+    async def test_no_transcript_is_not_retried(self):
+        """字幕がない場合は再試行しない"""
+        with patch(
+            "app.services.youtube._fetch_sync",
+            side_effect=YouTubeTranscriptError("なし", error_code="NO_TRANSCRIPT"),
+        ) as mock_fetch:
+            with pytest.raises(YouTubeTranscriptError) as exc_info:
+                await youtube.fetch_transcript_raw("dQw4w9WgXcQ", "ja")
+
+        assert exc_info.value.error_code == "NO_TRANSCRIPT"
+        assert mock_fetch.call_count == 1
+
+    @pytest.mark.asyncio
+    async def test_ip_block_without_proxy_is_not_retried(self):
+        """プロキシなしでの IP ブロックは同じIPからの再試行で解除されないため再試行しない"""
+        with patch.object(youtube, "_proxy_config", None), patch(
+            "app.services.youtube._fetch_sync",
+            side_effect=IpBlocked("dQw4w9WgXcQ"),
+        ) as mock_fetch:
+            with pytest.raises(YouTubeTranscriptError) as exc_info:
+                await youtube.fetch_transcript_raw("dQw4w9WgXcQ", "ja")
+
+        assert exc_info.value.error_code == "FETCH_FAILED"
+        assert mock_fetch.call_count == 1
+
+    @pytest.mark.asyncio
+    async def test_ip_block_with_proxy_is_retried(self):
+        """プロキシ経由なら出口IPが変わりうるため IP ブロックを再試行する"""
+        with patch.object(youtube, "_proxy_config", object()), patch(
+            "app.services.youtube._fetch_sync",
+            side_effect=[IpBlocked("dQw4w9WgXcQ"), []],
+        ) as mock_fetch:
+            result = await youtube.fetch_transcript_raw("dQw4w9WgXcQ", "ja")
+
+        assert result == []
+        assert mock_fetch.call_count == 2
+
+    @pytest.mark.asyncio
+    async def test_server_error_is_retried(self):
+        """YouTube の 5xx は一時的な失敗として再試行する"""
+        with patch(
+            "app.services.youtube._fetch_sync",
+            side_effect=[_request_failed(503), []],
+        ) as mock_fetch:
+            result = await youtube.fetch_transcript_raw("dQw4w9WgXcQ", "ja")
+
+        assert result == []
+        assert mock_fetch.call_count == 2
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("status_code", [403, 404])
+    async def test_client_error_is_not_retried(self, status_code):
+        """YouTube の 4xx は恒久的な失敗として再試行しない"""
+        with patch(
+            "app.services.youtube._fetch_sync",
+            side_effect=_request_failed(status_code),
+        ) as mock_fetch:
+            with pytest.raises(YouTubeTranscriptError) as exc_info:
+                await youtube.fetch_transcript_raw("dQw4w9WgXcQ", "ja")
+
+        assert exc_info.value.error_code == "FETCH_FAILED"
+        assert mock_fetch.call_count == 1
+
+
+class TestGetYttApi:
+    """YouTubeTranscriptApi インスタンス管理のテスト"""
+
+    def test_instance_is_reused_within_thread(self):
+        """同じスレッドでは同じインスタンス(と Session)を使い回す"""
+        with patch.object(youtube, "_thread_local", threading.local()):
+            assert youtube._get_ytt_api() is youtube._get_ytt_api()
+
+    def test_instance_is_separate_per_thread(self):
+        """スレッドごとに別のインスタンスを生成する"""
+        with patch.object(youtube, "_thread_local", threading.local()):
+            main_api = youtube._get_ytt_api()
+            other: list[object] = []
+            thread = threading.Thread(target=lambda: other.append(youtube._get_ytt_api()))
+            thread.start()
+            thread.join()
+            assert other[0] is not main_api
 
 
 class TestYouTubeTranscriptError:
@@ -123,3 +494,11 @@ class TestYouTubeTranscriptError:
         """カスタムエラーコードを設定できる"""
         error = YouTubeTranscriptError("テストエラー", error_code="CUSTOM_ERROR")
         assert error.error_code == "CUSTOM_ERROR"
+
+    def test_copy_and_pickle_keep_error_code(self):
+        """copy / pickle の往復でもメッセージとエラーコードが保たれる"""
+        error = YouTubeTranscriptError("テストエラー", error_code="NO_TRANSCRIPT")
+        for restored in (copy.copy(error), pickle.loads(pickle.dumps(error))):
+            assert restored.message == "テストエラー"
+            assert restored.error_code == "NO_TRANSCRIPT"
+            assert str(restored) == "テストエラー"